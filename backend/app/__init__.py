@@ -1,12 +1,45 @@
 from flask import Flask
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
+import logging
+import orjson
+import os
+import tempfile
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Loaders log progress at INFO and per-file detail at DEBUG; LOG_LEVEL=DEBUG shows both
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+# Like the stdlib json module, accept non-string dict keys (e.g. chunk ids) instead of raising
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(JSONProvider):
+    """Uses orjson for every jsonify() response and request.get_json() body."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=ORJSON_OPTIONS), mimetype="application/json")
+
+
 # Create the Flask app instance
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Uploaded documents are spooled here for the viewer instead of being kept in memory
+app.config['UPLOAD_FOLDER'] = os.getenv("UPLOAD_FOLDER", os.path.join(tempfile.gettempdir(), "spoon_uploads"))
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Add CORS support
 CORS(app)
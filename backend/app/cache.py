@@ -0,0 +1,90 @@
+# File: backend/app/cache.py
+# Purpose: Caches answers so repeated or paraphrased questions skip the LLM chains.
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _normalize_question(question):
+    """Collapses case, whitespace and trailing punctuation so trivial variants share a key."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!.").lower()
+
+
+class ResponseCache:
+    """
+    Two-tier answer cache for the currently loaded repository or document.
+    Exact repeats are found by hash; paraphrases are found by embedding cosine similarity.
+    """
+
+    def __init__(self, max_entries=512, similarity_threshold=0.92):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, context_id=None):
+        """Drops every entry. Called whenever a new repository or document is loaded."""
+        with self._lock:
+            self._context_id = context_id or ""
+            self._exact = OrderedDict()
+            # Semantic entries live in a preallocated ring buffer: row i of the
+            # matrix holds the unit-length embedding for self._answers[i].
+            self._matrix = None
+            self._answers = [None] * self.max_entries
+            self._count = 0
+            self._next_row = 0
+
+    def _key(self, question):
+        raw = f"{self._context_id}\0{_normalize_question(question)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, question):
+        """Returns the cached answer for an exact (normalized) repeat, or None."""
+        with self._lock:
+            key = self._key(question)
+            answer = self._exact.get(key)
+            if answer is not None:
+                self._exact.move_to_end(key)
+            return answer
+
+    def get_similar(self, embedding):
+        """Returns the answer of the most similar cached question above the threshold, or None."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            query = _unit_vector(embedding)
+            similarities = self._matrix[:self._count] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            return self._answers[best]
+
+    def put(self, question, answer, embedding=None):
+        """Stores an answer, optionally indexing it for similarity lookups as well."""
+        with self._lock:
+            key = self._key(question)
+            self._exact[key] = answer
+            self._exact.move_to_end(key)
+            if len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+            if embedding is None:
+                return
+            row = _unit_vector(embedding)
+            if self._matrix is None:
+                self._matrix = np.empty((self.max_entries, row.shape[0]), dtype=np.float32)
+            # Overwrite the oldest row once full instead of copying the whole matrix per insert
+            self._matrix[self._next_row] = row
+            self._answers[self._next_row] = answer
+            self._next_row = (self._next_row + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
+
+
+def _unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
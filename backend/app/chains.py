@@ -0,0 +1,198 @@
+# File: backend/app/chains.py
+# Purpose: Builds the Gemini clients, prompt templates and LangChain chains once at import.
+
+import os
+
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# The routes only ever use one model configuration, so share a single client
+# (and its connection pool) across every request.
+gemini_api_key = os.getenv("GEMINI_API_KEY")
+llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL, google_api_key=gemini_api_key, temperature=0.0)
+embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=gemini_api_key)
+
+
+# --- Repository / document chains ---
+
+# Classifies the intent and, for technical questions, the query type in a single call
+intent_classifier_prompt = ChatPromptTemplate.from_template(
+    """
+    You are a classifier for user input about a code repository. Determine both the intent and the query type.
+
+    Possible intents are "technical_question" or "conversational_reply":
+    - "technical_question": The user is asking for information ABOUT THE CODE REPOSITORY, its structure, functionality, etc. This also includes requests for more detail or elaboration on a previous answer (e.g., "what does this file do?", "explain the tech stack", "tell me more about that", "go into detail please").
+    - "conversational_reply": The user is NOT asking about the code. This includes simple social responses (e.g., "great", "thanks"), greetings, and direct questions to you, the AI (e.g., "what is your name?", "who are you?", "how was your day?").
+
+    Possible query types are "broad_query" or "specific_query":
+    - "broad_query": The user is asking for a high-level, general overview that requires understanding the whole project (e.g., "what does this codebase do?", "explain this project", "give me a summary", "what is the overall architecture?", "what are the key features?", "generate potential use cases").
+    - "specific_query": The user is asking about a particular file, function, or focused concept that can be answered from a small number of files (e.g., "what does the User model in `user.py` do?", "explain the `calculate_payment` function", "where are the database credentials stored?").
+    For a conversational reply, use "specific_query".
+
+    User Input: "{question}"
+
+    Respond with ONLY a JSON object of the form {{"intent": "technical_question" or "conversational_reply", "query_type": "broad_query" or "specific_query"}}.
+    """
+)
+intent_classifier_chain = intent_classifier_prompt | llm | JsonOutputParser()
+
+conversation_responder_prompt = ChatPromptTemplate.from_template(
+    """
+    You are Spoon, a friendly and helpful AI assistant for code analysis. The user has just said something to you directly. Provide a brief, polite, and natural response.
+
+    User's input: "{question}"
+    Your response:
+    """
+)
+conversation_chain = conversation_responder_prompt | llm | StrOutputParser()
+
+query_classifier_prompt = ChatPromptTemplate.from_template(
+    """
+    You are a query classifier. Your task is to determine if a user's question about a codebase is a "broad_query" or a "specific_query".
+
+    - "broad_query": The user is asking for a high-level, general overview. These questions require understanding the whole project.
+      Examples: "what does this codebase do?", "explain this project", "give me a summary", "what is the overall architecture?", "what are the key features?", "generate potential use cases"
+
+    - "specific_query": The user is asking about a particular file, function, or focused concept. These questions can be answered by looking at a small number of files.
+      Examples: "what does the User model in `user.py` do?", "explain the `calculate_payment` function", "where are the database credentials stored?"
+
+    Based on the user's question, what is the query type? Respond with ONLY "broad_query" or "specific_query".
+
+    User Question: "{question}"
+    Query Type:
+    """
+)
+query_classifier_chain = query_classifier_prompt | llm | StrOutputParser()
+
+# Used when local retrieval can't pick files: classifies the intent and query
+# type and plans the relevant files in a single call instead of three.
+intent_planner_prompt = ChatPromptTemplate.from_template(
+    """
+    You are an expert software engineer acting as both an intent classifier and a query planner for questions about a code repository.
+
+    First, classify the user's input:
+    - "technical_question": The user is asking for information ABOUT THE CODE REPOSITORY, its structure, functionality, etc. This also includes requests for more detail or elaboration on a previous answer (e.g., "what does this file do?", "explain the tech stack", "tell me more about that", "go into detail please").
+    - "conversational_reply": The user is NOT asking about the code. This includes simple social responses (e.g., "great", "thanks"), greetings, and direct questions to you, the AI (e.g., "what is your name?", "who are you?", "how was your day?").
+
+    Next, classify the query type:
+    - "broad_query": The user is asking for a high-level, general overview that requires understanding the whole project (e.g., "what does this codebase do?", "explain this project", "what is the overall architecture?", "generate potential use cases").
+    - "specific_query": The user is asking about a particular file, function, or focused concept (e.g., "explain the `calculate_payment` function", "where are the database credentials stored?"). Use this for a conversational reply too.
+
+    Then, if it is a specific technical question, identify the most relevant files to answer it from the file manifest below.
+    - Use the full paths exactly as listed.
+    - If no files seem relevant, use ["README.md"].
+    - For a conversational reply or a broad query, use an empty list.
+
+    User Input: "{question}"
+    Available Files:
+    {file_manifest}
+
+    Respond with ONLY a JSON object of the form {{"intent": "technical_question" or "conversational_reply", "query_type": "broad_query" or "specific_query", "files": ["path", ...]}}.
+    """
+)
+intent_planner_chain = intent_planner_prompt | llm | JsonOutputParser()
+
+responder_prompt = ChatPromptTemplate.from_template(
+    """
+    You are Spoon, an expert AI software engineer. Your primary function is to analyze a given codebase and answer questions as a senior developer would.
+
+    **Core Instructions:**
+    1.  **Analyze and Infer**: Your answer MUST be based on the provided CONTEXT. Do not just search for literal text. You are expected to read, understand, and interpret the code and text files to form your conclusions.
+    2.  **Synthesize and Generate**: When asked for abstract concepts like the project's 'purpose', 'problem it solves', 'intended users', or to **generate potential 'use cases'**, you MUST synthesize these answers by analyzing the entire context. Look at API routes, UI elements, dependencies, and comments to determine the application's function, audience, and practical applications.
+    3.  **Be Creative with Use Cases**: When asked for use cases, think practically about who would benefit from this tool and what specific problems it would solve for them. Generate a detailed list based on the project's confirmed features.
+    4.  **No External Knowledge**: Do not use any information outside of the provided CONTEXT. If the context genuinely doesn't provide enough information to form a conclusion, only then should you state that.
+
+    **CONTEXT:**
+    {context}
+
+    **CONVERSATION SO FAR** (use it to resolve follow-ups such as "tell me more"; the CONTEXT remains the source of truth):
+    {memory}
+
+    **Question:** {question}
+
+    **Answer:**
+    """
+)
+responder_chain = responder_prompt | llm | StrOutputParser()
+
+# The conversation memory goes after the static instructions and CONTEXT in the
+# responder prompt, so the long shared prefix stays cacheable on Gemini's side.
+memory_summary_prompt = ChatPromptTemplate.from_template(
+    """
+    Progressively summarize a conversation between a user and Spoon, an AI assistant for code analysis. Extend the current summary with the new lines and return a new summary of at most a few sentences. Keep file names, features and conclusions that later questions might refer back to.
+
+    Current summary:
+    {summary}
+
+    New lines of conversation:
+    {new_lines}
+
+    New summary:
+    """
+)
+memory_summary_chain = memory_summary_prompt | llm | StrOutputParser()
+
+
+# --- PDF chains ---
+
+pdf_intent_prompt = ChatPromptTemplate.from_template(
+    """
+    Classify the user's intent for a query about a PDF document. The intents are "pdf_summary", "pdf_query" or "general_chat".
+
+    - "pdf_summary": The user wants an overview of the whole document (e.g., "summarize this document", "what is this story about?", "list the key topics").
+    - "pdf_query": The user is asking something directly related to specific content of the PDF document (e.g., "what does section 3 say about regulations?", "who is the author?").
+    - "general_chat": The user is making a conversational comment, a greeting, or asking a question not related to the PDF content (e.g., "that's interesting", "thank you", "what else can you do?").
+
+    Based on the user's query below, respond with ONLY "pdf_summary", "pdf_query" or "general_chat".
+
+    User Query: "{question}"
+    Intent:
+    """
+)
+pdf_intent_chain = pdf_intent_prompt | llm | StrOutputParser()
+
+pdf_convo_prompt = ChatPromptTemplate.from_template("You are an AI assistant helping a user understand a PDF. The user has made a conversational comment. Respond politely and briefly. User's comment: '{question}'")
+pdf_convo_chain = pdf_convo_prompt | llm | StrOutputParser()
+
+pdf_responder_prompt = ChatPromptTemplate.from_template(
+    """
+    You are Spoon, an expert AI research assistant. Your task is to answer the user's question based on the provided text from a PDF document.
+
+    **Core Instructions:**
+    1.  **Synthesize, Don't Hallucinate**: You MUST base your entire answer on the "DOCUMENT CONTEXT". You are encouraged to synthesize information from multiple parts of the context to answer broader questions (like "what is this story about?"). However, do not add information or make assumptions that are not supported by the text.
+    2.  **Handle Missing Information**: If you are truly unable to answer the question from the provided context, state that the answer is not available in the provided text. Do not guess.
+    3.  **Format for Clarity**: Use Markdown for clear formatting (e.g., lists, bolding) to present the answer.
+
+    DOCUMENT CONTEXT:
+    {context}
+
+    User's Question: {question}
+
+    Answer:
+    """
+)
+pdf_responder_chain = pdf_responder_prompt | llm | StrOutputParser()
+
+pdf_merge_prompt = ChatPromptTemplate.from_template(
+    """
+    You are Spoon, an expert AI research assistant. Several draft answers to the same question were written, each from a different part of a PDF document. Combine them into one complete answer.
+
+    **Core Instructions:**
+    1.  **Merge, Don't Repeat**: Keep every relevant fact from the drafts, remove repetition, and organize the result as a single coherent answer.
+    2.  **Skip Empty Drafts**: Ignore drafts that only say the answer is not available in their part of the document.
+    3.  **No New Information**: Do not add anything that is not in the drafts. If no draft answers the question, state that the answer is not available in the provided text.
+    4.  **Format for Clarity**: Use Markdown for clear formatting (e.g., lists, bolding) to present the answer.
+
+    DRAFT ANSWERS:
+    {drafts}
+
+    User's Question: {question}
+
+    Answer:
+    """
+)
+pdf_merge_chain = pdf_merge_prompt | llm | StrOutputParser()
@@ -0,0 +1,108 @@
+# File: backend/app/classifier.py
+# Purpose: Cheap local intent classification so obvious cases skip the LLM classifier,
+#          and a cache of LLM classifier results for the rest.
+
+import re
+import threading
+from collections import OrderedDict
+
+# Messages made up only of social phrases: greetings, thanks, acknowledgements and questions about the assistant
+_SOCIAL_PHRASE = (
+    r"(hi|hello|hey|yo|thanks|thank you|thx|ty|ok|okay|great|cool|nice|awesome|perfect|got it|bye|goodbye"
+    r"|good (morning|afternoon|evening|night)|who are you|what is your name|what's your name|how are you( doing)?)"
+    r"( there| so much| a lot| again| spoon)?"
+)
+_CONVERSATIONAL_PATTERN = re.compile(rf"^({_SOCIAL_PHRASE}[\s,.!?]*)+$", re.IGNORECASE)
+
+# Anything that clearly refers to code: backticks, file names, paths or common programming vocabulary
+_TECHNICAL_PATTERN = re.compile(
+    r"`|\b[\w-]+\.[a-z]{1,5}\b|\w/\w"
+    r"|\b(code|codebase|repo|repository|project|file|files|folder|directory|function|functions|method|class|classes"
+    r"|module|api|endpoint|endpoints|route|routes|dependency|dependencies|stack|architecture|implement\w*|config\w*"
+    r"|install\w*|setup|error|bug|test|tests|database|schema|import|variable|library|libraries|framework"
+    r"|deploy\w*|readme|frontend|backend|model|models|tech)\b",
+    re.IGNORECASE,
+)
+
+_SUMMARY_PATTERN = re.compile(
+    r"\b(summar\w*|overview|tl;?dr|gist|key (points|topics|themes|takeaways)|main (idea|points|subject|topic)"
+    r"|what is (this|the) (document|paper|pdf|book|story|text) about)\b",
+    re.IGNORECASE,
+)
+
+
+# Replies for the most common one-phrase messages, so they skip the conversation chain too
+_GREETING_REPLY = "Hi! I'm Spoon. Ask me anything about what you've loaded."
+_THANKS_REPLY = "You're welcome! Let me know if you have any other questions."
+_ACK_REPLY = "Glad that helps! What would you like to look at next?"
+_CANNED_REPLIES = {
+    **dict.fromkeys(["hi", "hello", "hey", "hi there", "hello there", "hey there"], _GREETING_REPLY),
+    **dict.fromkeys(["thanks", "thank you", "thx", "ty", "thanks a lot", "thank you so much"], _THANKS_REPLY),
+    **dict.fromkeys(["ok", "okay", "great", "cool", "nice", "awesome", "perfect", "got it"], _ACK_REPLY),
+    **dict.fromkeys(["bye", "goodbye"], "Goodbye! Come back anytime."),
+    **dict.fromkeys(["who are you", "what is your name", "what's your name"],
+                    "I'm Spoon, an AI assistant that answers questions about code repositories and documents."),
+}
+
+
+def canned_reply(question):
+    """Returns a fixed reply for a trivial social message such as "thanks", or None."""
+    normalized = re.sub(r"\s+", " ", question).strip().rstrip("!.?").strip().lower()
+    return _CANNED_REPLIES.get(normalized)
+
+
+def normalize_label(label):
+    """Normalizes an LLM classifier label for exact comparison: no whitespace, quotes or trailing punctuation, lowercase."""
+    return str(label or "").strip().strip("\"'`.").strip().lower()
+
+
+def _is_small_talk(question):
+    return _CONVERSATIONAL_PATTERN.match(question.strip()) is not None
+
+
+def classify_repo_intent(question):
+    """
+    Returns "technical_question" or "conversational_reply" when the answer is obvious,
+    or None when the LLM classifier should decide.
+    """
+    if _is_small_talk(question):
+        return "conversational_reply"
+    if _TECHNICAL_PATTERN.search(question):
+        return "technical_question"
+    return None
+
+
+def classify_pdf_intent(question):
+    """
+    Returns "general_chat" or "pdf_summary" when the answer is obvious,
+    or None when the LLM classifier should decide.
+    """
+    if _is_small_talk(question):
+        return "general_chat"
+    if _SUMMARY_PATTERN.search(question):
+        return "pdf_summary"
+    return None
+
+
+# The classifier chains run at temperature 0 and only see the question, so their
+# labels can be reused across sessions for repeated questions.
+LLM_LABEL_CACHE_SIZE = 1024
+_llm_labels = OrderedDict()
+_llm_labels_lock = threading.Lock()
+
+
+async def classify_with_llm(chain, question):
+    """Invokes a question-only classifier chain, reusing the result for a question seen before."""
+    # Chains are module-level singletons, so their id is a stable part of the key
+    key = (id(chain), question.strip().lower())
+    with _llm_labels_lock:
+        if key in _llm_labels:
+            _llm_labels.move_to_end(key)
+            return _llm_labels[key]
+
+    labels = await chain.ainvoke({"question": question})
+    with _llm_labels_lock:
+        _llm_labels[key] = labels
+        if len(_llm_labels) > LLM_LABEL_CACHE_SIZE:
+            _llm_labels.popitem(last=False)
+    return labels
@@ -0,0 +1,58 @@
+# File: backend/app/compression.py
+# Purpose: Keeps loaded chunks zstd-compressed in memory and decompresses them only when read.
+
+import random
+
+import zstandard as zstd
+
+COMPRESSION_LEVEL = 3
+
+# Training a dictionary only pays off once there are enough chunks to learn from
+DICT_MIN_SAMPLES = 64
+DICT_SAMPLE_SIZE = 1000
+DICT_SIZE = 64 * 1024
+
+
+class CompressedDoc:
+    """
+    Drop-in stand-in for a LangChain Document whose text is stored compressed.
+    The routes only ever read page_content and metadata, both of which are kept.
+    """
+    __slots__ = ("metadata", "_data", "_dict_data")
+
+    def __init__(self, data, metadata, dict_data=None):
+        self.metadata = metadata
+        self._data = data
+        self._dict_data = dict_data
+
+    @property
+    def page_content(self):
+        # Decompressors aren't safe to share across request threads, and creating one is cheap
+        decompressor = zstd.ZstdDecompressor(dict_data=self._dict_data) if self._dict_data else zstd.ZstdDecompressor()
+        return decompressor.decompress(self._data).decode("utf-8")
+
+
+def _train_dictionary(samples):
+    """Trains a shared dictionary on a sample of chunks, or returns None if there are too few."""
+    if len(samples) < DICT_MIN_SAMPLES:
+        return None
+    sample = random.Random(0).sample(samples, min(DICT_SAMPLE_SIZE, len(samples)))
+    try:
+        return zstd.train_dictionary(DICT_SIZE, sample)
+    except zstd.ZstdError:
+        # Training fails on samples that are too small or too uniform; plain zstd still works
+        return None
+
+
+def compress_docs(docs):
+    """Returns CompressedDoc copies of the given documents, sharing one trained dictionary."""
+    encoded = [doc.page_content.encode("utf-8") for doc in docs]
+    dict_data = _train_dictionary(encoded)
+    if dict_data:
+        compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dict_data)
+    else:
+        compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL)
+    return [
+        CompressedDoc(compressor.compress(data), doc.metadata, dict_data)
+        for doc, data in zip(docs, encoded)
+    ]
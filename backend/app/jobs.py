@@ -0,0 +1,54 @@
+# File: backend/app/jobs.py
+# Purpose: Runs slow repository and document loads in the background and tracks them by job id.
+
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Loads are network- or parse-bound, so a few threads are enough to keep them off the request workers
+MAX_WORKERS = 4
+
+# Finished jobs are kept around for polling, up to this many
+MAX_JOBS = 256
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="load-job")
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def submit(job_id, fn, *args):
+    """
+    Starts fn(*args) in the background under the given job id. fn should return a
+    success message, or raise ValueError with a message meant for the user.
+    """
+    future = _executor.submit(fn, *args)
+    with _jobs_lock:
+        _jobs[job_id] = future
+        if len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+
+
+def status(job_id):
+    """
+    Returns {"status": "pending"}, {"status": "done", "message": ...} or
+    {"status": "error", "error": ...} for a job, or None if the id is unknown.
+    """
+    with _jobs_lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        return None
+    if not future.done():
+        return {"status": "pending"}
+
+    error = future.exception()
+    if error is None:
+        return {"status": "done", "message": future.result()}
+    if isinstance(error, ValueError):
+        return {"status": "error", "error": str(error)}
+    print(f"Unexpected error in load job {job_id}: {error}")
+    return {"status": "error", "error": "An unexpected server error occurred."}
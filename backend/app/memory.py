@@ -0,0 +1,56 @@
+# File: backend/app/memory.py
+# Purpose: Per-session conversation memory: the last few turns verbatim plus a rolling summary of older ones.
+
+import threading
+from collections import deque
+
+# Turns kept verbatim; older turns are folded into the summary
+MAX_TURNS = 4
+
+# Long answers are clipped before they go into memory so follow-up prompts stay small
+MAX_ANSWER_CHARS = 1500
+
+
+class ConversationMemory:
+    """Windowed conversation buffer with a rolling summary of everything that fell out of the window."""
+
+    def __init__(self, max_turns=MAX_TURNS):
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forgets the whole conversation. Called whenever a new repository or document is loaded."""
+        with self._lock:
+            self.summary = ""
+            self._turns = deque()
+
+    def render(self):
+        """Formats the summary and recent turns for the responder prompt."""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation:\n{self.summary}")
+            if self._turns:
+                parts.append("Recent turns:\n" + "\n".join(_format_turn(q, a) for q, a in self._turns))
+        return "\n\n".join(parts) or "(no previous conversation)"
+
+    def add_turn(self, question, answer):
+        """
+        Records a turn. Returns the formatted turns that fell out of the window,
+        which the caller should fold into the summary with update_summary().
+        """
+        with self._lock:
+            self._turns.append((question, answer[:MAX_ANSWER_CHARS]))
+            evicted = []
+            while len(self._turns) > self.max_turns:
+                evicted.append(_format_turn(*self._turns.popleft()))
+        return "\n".join(evicted)
+
+    def update_summary(self, summary):
+        with self._lock:
+            self.summary = summary.strip()
+
+
+def _format_turn(question, answer):
+    return f"User: {question}\nSpoon: {answer}"
@@ -0,0 +1,112 @@
+# File: backend/app/retrieval.py
+# Purpose: Local retrieval helpers that pick relevant chunks without an LLM round-trip.
+
+import heapq
+import re
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+# Below this top score the lexical match is too weak to trust, and the
+# routes fall back to the LLM planner instead.
+BM25_MIN_SCORE = 3.0
+BM25_TOP_K = 8
+
+# Upper bound on how many manifest paths are sent to the LLM planner
+MANIFEST_TOP_K = 200
+
+# Root files that describe the project are always offered to the planner
+ALWAYS_INCLUDE_PATHS = ("README.md", "package.json", "pyproject.toml")
+
+# A manifest longer than this is split into slices planned concurrently, so no single prompt gets too long
+MANIFEST_MAX_CHARS = 12000
+MANIFEST_SLICE_SIZE = 50
+
+# Number of PDF chunks retrieved by embedding similarity
+PDF_TOP_K = 5
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercases text and splits it into alphanumeric tokens (paths split on / . _ too)."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def build_bm25_index(docs):
+    """
+    Builds a BM25 index over each chunk's source path and the start of its content.
+    Returns None when there is nothing to index.
+    """
+    corpus = [tokenize(f"{doc.metadata.get('source', '')} {doc.page_content[:500]}") for doc in docs]
+    if not any(corpus):
+        return None
+    return BM25Okapi(corpus)
+
+
+def bm25_top_docs(index, docs, question, k=BM25_TOP_K, min_score=BM25_MIN_SCORE):
+    """
+    Returns up to k chunks ranked by BM25 score for the question.
+    Returns an empty list when the best match scores below min_score.
+    """
+    query_tokens = tokenize(question)
+    if index is None or not query_tokens:
+        return []
+
+    scores = index.get_scores(query_tokens)
+    if scores.max() < min_score:
+        return []
+
+    if k < len(scores):
+        top = np.argpartition(scores, -k)[-k:]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(scores[top])[::-1]]
+    return [docs[i] for i in top if scores[i] > 0]
+
+
+def prefilter_manifest(paths, question, k=MANIFEST_TOP_K):
+    """
+    Keeps the k paths that share the most words with the question, so the
+    planner prompt stays small no matter how many files the repository has.
+    Root files in ALWAYS_INCLUDE_PATHS are kept regardless of their score.
+    """
+    if len(paths) <= k:
+        return paths
+
+    roots = [path for path in paths if path in ALWAYS_INCLUDE_PATHS]
+    others = [path for path in paths if path not in ALWAYS_INCLUDE_PATHS]
+
+    words = set(tokenize(question))
+    def score(path):
+        lowered = path.lower()
+        return sum(1 for word in words if word in lowered)
+
+    # nlargest is stable, so ties keep their manifest order
+    return roots + heapq.nlargest(max(k - len(roots), 0), others, key=score)
+
+
+def manifest_slices(paths, max_chars=MANIFEST_MAX_CHARS, slice_size=MANIFEST_SLICE_SIZE):
+    """Returns the manifest as one slice, or as slices of slice_size paths when it is longer than max_chars."""
+    if sum(len(path) + 1 for path in paths) <= max_chars:
+        return [paths]
+    return [paths[i:i + slice_size] for i in range(0, len(paths), slice_size)]
+
+
+def embedding_matrix(vectors):
+    """Stacks embeddings into a float32 matrix of unit-length rows, ready for cosine scoring."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_similar(matrix, query_vector, k=PDF_TOP_K):
+    """Returns the row indices of the k rows most similar to the query, in ascending order."""
+    query = np.asarray(query_vector, dtype=np.float32)
+    similarities = matrix @ (query / (np.linalg.norm(query) or 1.0))
+    if k < len(similarities):
+        top = np.argpartition(similarities, -k)[-k:]
+    else:
+        top = np.arange(len(similarities))
+    return np.sort(top)
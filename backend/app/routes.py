@@ -1,30 +1,66 @@
 # File: backend/app/routes.py
 # Purpose: Defines all API endpoints and page-serving routes.
 
-from flask import request, jsonify, render_template, send_file, send_from_directory
+from flask import request, jsonify, render_template, send_file, send_from_directory, Response, stream_with_context
 import os
-from io import BytesIO
+import orjson
 from werkzeug.utils import secure_filename
-import concurrent.futures
-
-# LangChain imports
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
+import itertools
+import re
+import shutil
+import uuid
+from collections import Counter
 
 from app import app
 from . import services
+from . import chains
+from . import retrieval
+from . import classifier
+from . import jobs
+from .compression import compress_docs
+from .state import get_state, attach_session_cookie
+
+# Each browser gets its own in-memory SessionState, identified by a cookie
+app.after_request(attach_session_cookie)
+
+# When enabled, "show me <file>" questions that resolve to a single small chunk
+# are answered with the file itself instead of a responder call.
+SHOW_FILE_SHORTCUT = os.getenv("SPOON_SHOW_FILE_SHORTCUT", "1") == "1"
+SHOW_FILE_MAX_CHARS = 4000
+_SHOW_FILE_PATTERN = re.compile(r"\b(show|display|print|contents of)\b", re.IGNORECASE)
+
+
+def _index_docs_by_source(docs):
+    """Groups document chunks by their source path, preserving load order."""
+    by_source = {}
+    for doc in docs:
+        by_source.setdefault(doc.metadata.get("source", ""), []).append(doc)
+    return by_source
+
+
+def _indexed_docs(docs):
+    """Returns the session fields for loaded docs: the docs themselves plus the lookup structures built from them."""
+    bm25 = retrieval.build_bm25_index(docs)
+
+    # Chunks sit in memory for the whole session but only a handful are read per question
+    compressed = compress_docs(docs)
+
+    # Index once here so each question can look files up without rescanning every chunk
+    by_source = _index_docs_by_source(compressed)
+    return {"docs": compressed, "by_source": by_source, "file_manifest": list(by_source), "bm25": bm25}
 
-# In-memory store for a single session (works on Render free tier)
-session_data = {
-    "docs": None,
-    "file_manifest": None,
-    "repo_url": None,
-    "pdf_docs": None,
-    "document_filename": None, # Stores filename for the viewer
-    "document_content": None,  # Stores raw file bytes for the viewer
-    "document_mimetype": None # Stores the file's mimetype
-}
+
+def _spool_upload(state, file):
+    """Copies an upload to UPLOAD_FOLDER in blocks and records it on the session for the viewer."""
+    state.document_filename = secure_filename(file.filename)
+    state.document_mimetype = file.mimetype
+
+    # A unique prefix keeps sessions that upload the same filename from overwriting each other
+    state.document_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{state.document_filename}")
+    file.stream.seek(0)
+    with open(state.document_path, "wb") as out:
+        shutil.copyfileobj(file.stream, out, length=65536)
 
 # --- Page Rendering Routes ---
 
@@ -43,42 +79,34 @@ def analysis():
 
 @app.route('/api/load_repo', methods=['POST'])
 def load_repo_route():
-    """Loads a repository's data and ensures all other data is cleared."""
-    global session_data
+    """Starts loading a repository in the background and ensures all other data is cleared."""
+    state = get_state()
     data = request.get_json()
     repo_url = data.get('url')
 
     if not repo_url:
         return jsonify({"error": "Repository URL is required"}), 400
 
-    try:
-        # Clear any leftover document data from previous sessions
-        session_data["pdf_docs"] = None
-        session_data["document_filename"] = None
-        session_data["document_content"] = None
-        session_data["document_mimetype"] = None
-
-        docs = services.fetch_repo_docs(repo_url)
-        session_data["docs"] = docs
-        
-        file_manifest = "\n".join([doc.metadata.get("source", "") for doc in docs])
-        session_data["file_manifest"] = file_manifest
-        
-        session_data["repo_url"] = repo_url
-        
-        return jsonify({"message": f"Successfully loaded and processed {len(docs)} document chunks from: {repo_url}. Ready for questions."}), 200
+    with state.lock:
+        # Clear any leftover repo or document data from this session
+        state.clear()
 
-    except ValueError as ve:
-        return jsonify({"error": str(ve)}), 400
-    except Exception as e:
-        print(f"Unexpected error in /api/load_repo: {e}")
-        return jsonify({"error": "An unexpected server error occurred."}), 500
+        # Fetching is slow, blocking network I/O, so it runs as a job the client polls
+        job_id = _start_load_job(state, _load_repo_job, repo_url)
+    return jsonify({"job_id": job_id, "message": f"Loading repository: {repo_url}"}), 202
+
+
+def _load_repo_job(state, job_id, repo_url):
+    docs = services.fetch_repo_docs(repo_url)
+    if not _finish_load(state, job_id, repo_url, repo_url=repo_url, **_indexed_docs(docs)):
+        return "Superseded by a newer load."
+    return f"Successfully loaded and processed {len(docs)} document chunks from: {repo_url}. Ready for questions."
 
 
 @app.route('/api/load_file', methods=['POST'])
 def load_file_route():
-    """Loads a non-PDF file (.md, .txt) entirely in-memory."""
-    global session_data
+    """Spools a non-PDF file (.md, .txt) to disk and starts processing it in the background."""
+    state = get_state()
     if 'file' not in request.files:
         return jsonify({"error": "No file part in the request"}), 400
     file = request.files['file']
@@ -86,42 +114,32 @@ def load_file_route():
         return jsonify({"error": "No selected file"}), 400
     
     try:
-        # Clear all other session data for a clean slate
-        session_data.update({
-            "pdf_docs": None, "repo_url": None, "docs": None, "file_manifest": None
-        })
-
-        # Read the entire file into memory for both processing and viewing
-        file_content_bytes = file.read()
-        
-        # Store for the viewer
-        session_data["document_filename"] = secure_filename(file.filename)
-        session_data["document_content"] = file_content_bytes
-        session_data["document_mimetype"] = file.mimetype
-        
-        # Create a new in-memory stream for the processing function
-        file_stream_for_processing = BytesIO(file_content_bytes)
-        file_stream_for_processing.filename = file.filename # Add filename attribute for the service
-        
-        docs = services.process_uploaded_file_docs(file_stream_for_processing)
-        session_data["docs"] = docs
-        
-        file_manifest = "\n".join([doc.metadata.get("source", "") for doc in docs])
-        session_data["file_manifest"] = file_manifest
-        
-        return jsonify({"message": f"Successfully loaded {len(docs)} document chunks from: {file.filename}. Ready for questions."}), 200
+        with state.lock:
+            # Clear all other session data for a clean slate
+            state.clear()
+
+            # The upload stream only lives as long as the request, so the job reads the spooled copy
+            _spool_upload(state, file)
+            job_id = _start_load_job(state, _load_file_job, state.document_path, file.filename)
+        return jsonify({"job_id": job_id, "message": f"Loading document: {file.filename}"}), 202
         
-    except ValueError as ve:
-        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         print(f"Unexpected error in /api/load_file: {e}")
         return jsonify({"error": "An unexpected server error occurred."}), 500
 
 
+def _load_file_job(state, job_id, path, filename):
+    with open(path, "rb") as file_stream:
+        docs = services.process_uploaded_file_docs(file_stream, filename)
+    if not _finish_load(state, job_id, path, **_indexed_docs(docs)):
+        return "Superseded by a newer load."
+    return f"Successfully loaded {len(docs)} document chunks from: {filename}. Ready for questions."
+
+
 @app.route('/api/load_pdf', methods=['POST'])
 def load_pdf_route():
-    """Loads a PDF file entirely in-memory."""
-    global session_data
+    """Spools a PDF file to disk and starts processing it in the background."""
+    state = get_state()
     if 'file' not in request.files:
         return jsonify({"error": "No file was included in the request."}), 400
     
@@ -130,318 +148,531 @@ def load_pdf_route():
         return jsonify({"error": "No file was selected."}), 400
 
     try:
-        # Clear all other session data for a clean slate
-        session_data.update({
-            "docs": None, "repo_url": None, "pdf_docs": None, "file_manifest": None
-        })
-
-        # Read the entire file into memory for both processing and viewing
-        file_content_bytes = pdf_file.read()
+        with state.lock:
+            # Clear all other session data for a clean slate
+            state.clear()
 
-        # Store for the viewer
-        session_data["document_filename"] = secure_filename(pdf_file.filename)
-        session_data["document_content"] = file_content_bytes
-        session_data["document_mimetype"] = pdf_file.mimetype
+            # The upload stream only lives as long as the request, so the job reads the spooled copy
+            _spool_upload(state, pdf_file)
+            job_id = _start_load_job(state, _load_pdf_job, state.document_path, pdf_file.filename)
+        return jsonify({"job_id": job_id, "message": f"Processing '{pdf_file.filename}'..."}), 202
 
-        # Create a new in-memory stream for the processing function
-        file_stream_for_processing = BytesIO(file_content_bytes)
-        file_stream_for_processing.filename = pdf_file.filename # Add filename attribute for the service
-
-        pdf_docs = services.process_pdf_file_and_chunk(file_stream_for_processing)
-        session_data["pdf_docs"] = pdf_docs
-        
-        return jsonify({
-            "message": f"Successfully processed '{pdf_file.filename}' into {len(pdf_docs)} chunks. You may now ask questions about the PDF."
-        }), 200
-
-    except ValueError as ve:
-        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         print(f"Error in new /api/load_pdf route: {e}")
         return jsonify({"error": "A server error occurred while processing the PDF."}), 500
 
 
-@app.route('/api/ask_question', methods=['POST'])
-# In backend/app/routes.py
+def _load_pdf_job(state, job_id, path, filename):
+    with open(path, "rb") as file_stream:
+        pdf_docs = services.process_pdf_file_and_chunk(file_stream, filename)
+
+    # Embed every chunk once so questions can be matched locally instead of by an LLM planner
+    pdf_embeddings = None
+    if pdf_docs:
+        pdf_embeddings = retrieval.embedding_matrix(
+            chains.embeddings.embed_documents([doc.page_content for doc in pdf_docs])
+        )
+    if not _finish_load(state, job_id, path, pdf_docs=compress_docs(pdf_docs), pdf_embeddings=pdf_embeddings):
+        return "Superseded by a newer load."
+    return f"Successfully processed '{filename}' into {len(pdf_docs)} chunks. You may now ask questions about the PDF."
+
+
+def _start_load_job(state, job_fn, *args):
+    """Runs job_fn(state, job_id, *args) in the background and marks it as the session's current load."""
+    job_id = jobs.new_job_id()
+    # A job only stores its results if no newer load has started for the session since
+    state.load_job_id = job_id
+    jobs.submit(job_id, job_fn, state, job_id, *args)
+    return job_id
+
+
+def _finish_load(state, job_id, context_id, **loaded_fields):
+    """
+    Stores a finished load's results on the session in one step, so concurrent questions never
+    see half of them. Returns False, storing nothing, if a newer load has started since.
+    """
+    with state.lock:
+        if state.load_job_id != job_id:
+            return False
+        for name, value in loaded_fields.items():
+            setattr(state, name, value)
+        state.response_cache.reset(context_id)
+        return True
+
+
+@app.route('/api/job_status/<job_id>', methods=['GET'])
+def job_status_route(job_id):
+    """Reports whether a background load is still running, finished, or failed."""
+    job_status = jobs.status(job_id)
+    if job_status is None:
+        return jsonify({"error": "Unknown job id."}), 404
+    return jsonify(job_status), 200
+
 
 @app.route('/api/ask_question', methods=['POST'])
-@app.route('/api/ask_question', methods=['POST'])
-def ask_question_route():
+async def ask_question_route():
     """
     Handles a user's question about a repository or non-PDF document.
     """
-    global session_data
+    state = get_state()
     data = request.get_json()
     question = data.get('question')
 
-    all_docs = session_data.get("docs")
-    file_manifest = session_data.get("file_manifest")
-
     if not question:
         return jsonify({"error": "A question is required"}), 400
-    if not all_docs:
+    if not state.docs:
         return jsonify({"error": "Please load a repository or file first."}), 400
+
+    try:
+        answer, responder_inputs, question_embedding = await _prepare_repo_answer(state, question)
+        if answer is not None:
+            return jsonify({"response": answer}), 200
+
+        # Step 4: The final answering step, now with the correct context.
+        answer = await chains.responder_chain.ainvoke(responder_inputs)
+        state.response_cache.put(question, answer, question_embedding)
+        await _remember(state, question, answer)
+        
+        return jsonify({"response": answer}), 200
         
+    except Exception as e:
+        print(f"Unexpected error in /api/ask_question: {e}")
+        return jsonify({"error": f"Failed to get a response from the AI. Error: {str(e)}"}), 500
+
+
+@app.route('/api/ask_question_stream', methods=['POST'])
+async def ask_question_stream_route():
+    """
+    Same as /api/ask_question, but streams the answer as Server-Sent Events
+    so the client can render tokens as soon as Gemini produces them.
+    """
+    state = get_state()
+    data = request.get_json()
+    question = data.get('question')
+
+    if not question:
+        return jsonify({"error": "A question is required"}), 400
+    if not state.docs:
+        return jsonify({"error": "Please load a repository or file first."}), 400
+
+    try:
+        answer, responder_inputs, question_embedding = await _prepare_repo_answer(state, question)
+    except Exception as e:
+        print(f"Unexpected error in /api/ask_question_stream: {e}")
+        return jsonify({"error": f"Failed to get a response from the AI. Error: {str(e)}"}), 500
+
+    def on_complete(answer_text):
+        state.response_cache.put(question, answer_text, question_embedding)
+        _remember_sync(state, question, answer_text)
+
+    return _sse_response(_answer_events(
+        answer, chains.responder_chain, responder_inputs, on_complete,
+        "/api/ask_question_stream", "Failed to get a response from the AI."
+    ))
+
+
+async def _remember(state, question, answer):
+    """Adds a turn to the session's conversation memory, summarizing turns that fall out of the window."""
+    evicted = state.memory.add_turn(question, answer)
+    if evicted:
+        try:
+            summary = await chains.memory_summary_chain.ainvoke({"summary": state.memory.summary or "(none)", "new_lines": evicted})
+            state.memory.update_summary(summary)
+        except Exception as e:
+            print(f"Could not update conversation summary: {e}")
+
+
+def _remember_sync(state, question, answer):
+    """Same as _remember, for the streaming generator which runs outside the event loop."""
+    evicted = state.memory.add_turn(question, answer)
+    if evicted:
+        try:
+            summary = chains.memory_summary_chain.invoke({"summary": state.memory.summary or "(none)", "new_lines": evicted})
+            state.memory.update_summary(summary)
+        except Exception as e:
+            print(f"Could not update conversation summary: {e}")
+
+
+def _answer_events(answer, chain, chain_inputs, on_complete, route, error_message):
+    """
+    Yields an answer as Server-Sent Events: the ready answer when there is one,
+    otherwise the chain's output token by token.
+    """
+    if answer is not None:
+        yield _sse_event({"token": answer})
+        yield _sse_event({"done": True})
+        return
+
+    parts = []
     try:
-        gemini_api_key = os.getenv("GEMINI_API_KEY")
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", google_api_key=gemini_api_key, temperature=0.0)
+        for chunk in chain.stream(chain_inputs):
+            parts.append(chunk)
+            yield _sse_event({"token": chunk})
+    except Exception as e:
+        print(f"Error while streaming {route}: {e}")
+        yield _sse_event({"error": f"{error_message} Error: {str(e)}"})
+        return
+    yield _sse_event({"done": True})
 
-        # Step 1: Classify if the input is a real question or just conversation
-        intent_classifier_prompt = ChatPromptTemplate.from_template(
-            """
-            You are an intent classifier. Your job is to determine if a user's input is a technical question about a code repository or a simple conversational reply/question.
-            Possible intents are: "technical_question" or "conversational_reply".
+    # The client already has the whole answer, so caching and memory updates add no visible latency
+    on_complete("".join(parts))
 
-            - "technical_question": The user is asking for information ABOUT THE CODE REPOSITORY, its structure, functionality, etc. This also includes requests for more detail or elaboration on a previous answer (e.g., "what does this file do?", "explain the tech stack", "tell me more about that", "go into detail please").
-            - "conversational_reply": The user is NOT asking about the code. This includes simple social responses (e.g., "great", "thanks"), greetings, and direct questions to you, the AI (e.g., "what is your name?", "who are you?", "how was your day?").
 
-            Based on the following user input, what is the intent? Respond with ONLY "technical_question" or "conversational_reply".
+def _sse_event(payload):
+    """Formats a payload as a single Server-Sent Events message."""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
 
-            User Input: "{question}"
-            Intent:
-            """
-        )
-        intent_classifier_chain = intent_classifier_prompt | llm | StrOutputParser()
-        intent = intent_classifier_chain.invoke({"question": question})
 
-        print(f"--- User Intent Classified as: {intent} ---")
+def _sse_response(events):
+    """Wraps an event generator in a streaming response that proxies won't buffer."""
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        if "conversational_reply" in intent.lower():
-            conversation_responder_prompt = ChatPromptTemplate.from_template(
-                """
-                You are Spoon, a friendly and helpful AI assistant for code analysis. The user has just said something to you directly. Provide a brief, polite, and natural response.
-
-                User's input: "{question}"
-                Your response:
-                """
-            )
-            conversation_chain = conversation_responder_prompt | llm | StrOutputParser()
-            answer = conversation_chain.invoke({"question": question})
-            return jsonify({"response": answer})
-        
+
+async def _prepare_repo_answer(state, question):
+    """
+    Runs every step before the responder for a repository/file question.
+    Returns (answer, None, embedding) when no responder call is needed (cache hit
+    or conversational reply), otherwise (None, responder_inputs, embedding).
+    """
+    # Read everything once under the lock, so a load finishing mid-question can't mix two repos
+    with state.lock:
+        all_docs = state.docs
+        by_source = state.by_source or {}
+        file_manifest = state.file_manifest
+        bm25 = state.bm25
+    response_cache = state.response_cache
+
+    canned = classifier.canned_reply(question)
+    if canned is not None:
+        return canned, None, None
+
+    cached_answer = response_cache.get(question)
+    if cached_answer is not None:
+        print("--- Answer served from exact-match cache ---")
+        return cached_answer, None, None
+
+    intent_task = None
+    query_task = None
+    router_task = None
+    embedding_task = None
+    try:
+        # A local BM25 lookup usually finds the relevant chunks in microseconds;
+        # the LLM planner is only needed when the lexical match is weak.
+        bm25_docs = retrieval.bm25_top_docs(bm25, all_docs, question)
+
+        # Step 1: Classify the intent (real question or just conversation) and the
+        # query type (broad or specific). Obvious intents are decided locally;
+        # otherwise one LLM call returns both labels, and also plans which files
+        # to read when there is no BM25 match.
+        local_intent = classifier.classify_repo_intent(question)
+        if bm25_docs:
+            if local_intent is None:
+                intent_task = asyncio.create_task(classifier.classify_with_llm(chains.intent_classifier_chain, question))
+            elif local_intent == "technical_question":
+                query_task = asyncio.create_task(classifier.classify_with_llm(chains.query_classifier_chain, question))
+        elif local_intent != "conversational_reply":
+            planner_slices = retrieval.manifest_slices(retrieval.prefilter_manifest(file_manifest, question))
+            router_task = asyncio.create_task(_plan_files(question, planner_slices))
+        embedding_task = asyncio.create_task(chains.embeddings.aembed_query(question))
+
+        # The embedding returns well before the chains; a paraphrase hit skips them entirely
+        question_embedding = await embedding_task
+        cached_answer = response_cache.get_similar(question_embedding)
+        if cached_answer is not None:
+            print("--- Answer served from semantic cache ---")
+            return cached_answer, None, question_embedding
+
+        planned_files = []
+        query_type = ""
+        if router_task:
+            routing = await router_task
+            if not isinstance(routing, dict):
+                routing = {}
+            intent = classifier.normalize_label(routing.get("intent"))
+            query_type = classifier.normalize_label(routing.get("query_type"))
+            planned_files = routing.get("files") or []
+            if isinstance(planned_files, str):
+                planned_files = planned_files.split(',')
+        elif intent_task:
+            labels = await intent_task
+            if not isinstance(labels, dict):
+                labels = {}
+            intent = classifier.normalize_label(labels.get("intent"))
+            query_type = classifier.normalize_label(labels.get("query_type"))
         else:
-            # Step 2: Classify if the technical question is broad or specific.
-            query_classifier_prompt = ChatPromptTemplate.from_template(
-                """
-                You are a query classifier. Your task is to determine if a user's question about a codebase is a "broad_query" or a "specific_query".
-
-                - "broad_query": The user is asking for a high-level, general overview. These questions require understanding the whole project.
-                  Examples: "what does this codebase do?", "explain this project", "give me a summary", "what is the overall architecture?", "what are the key features?", "generate potential use cases"
-
-                - "specific_query": The user is asking about a particular file, function, or focused concept. These questions can be answered by looking at a small number of files.
-                  Examples: "what does the User model in `user.py` do?", "explain the `calculate_payment` function", "where are the database credentials stored?"
-
-                Based on the user's question, what is the query type? Respond with ONLY "broad_query" or "specific_query".
-
-                User Question: "{question}"
-                Query Type:
-                """
-            )
-            query_classifier_chain = query_classifier_prompt | llm | StrOutputParser()
-            query_type = query_classifier_chain.invoke({"question": question})
-            print(f"--- Query classified as: {query_type} ---")
-
-            relevant_docs = []
-
-            # Step 3: Decide whether to use the file-picking planner based on the query type.
-            if "broad_query" in query_type.lower():
-                print("--- Broad query detected. Using full context. ---")
-                relevant_docs = all_docs
-            else: # "specific_query"
-                print("--- Specific query detected. Running planner to find relevant files... ---")
-                planner_prompt = ChatPromptTemplate.from_template(
-                    """
-                    You are an expert software engineer acting as a query planner.
-                    Your task is to identify the most relevant files to answer the user's question based on the provided file manifest.
-                    User Question: "{question}"
-                    Available Files:
-                    {file_manifest}
-                    Instructions:
-                    - List the full paths of the most relevant files, separated by commas.
-                    - Do not explain your reasoning.
-                    - If no files seem relevant, respond with "README.md".
-                    - Be concise. Your output should only be a comma-separated list of file paths.
-                    Relevant Files:
-                    """
-                )
-                planner_chain = planner_prompt | llm | StrOutputParser()
-                
-                relevant_files_str = planner_chain.invoke({ "question": question, "file_manifest": file_manifest })
-                relevant_file_paths = [f.strip() for f in relevant_files_str.split(',') if f.strip()]
-                print(f"--- Planner identified relevant files: {relevant_file_paths} ---")
-
-                relevant_docs = [doc for doc in all_docs if doc.metadata.get("source") in relevant_file_paths]
-                
-                if not relevant_docs: # Fallback
-                    relevant_docs = [doc for doc in all_docs if "README.md" in doc.metadata.get("source", "")]
+            intent = local_intent
+
+        print(f"--- User Intent Classified as: {intent} ---")
+
+        if intent == "conversational_reply":
+            answer = await chains.conversation_chain.ainvoke({"question": question})
+            response_cache.put(question, answer, question_embedding)
+            return answer, None, question_embedding
+
+        # Step 2: Only a locally classified question still needs its query type
+        if query_task:
+            query_type = classifier.normalize_label(await query_task)
+        print(f"--- Query classified as: {query_type} ---")
+
+        relevant_docs = []
+
+        # Step 3: Decide whether to use the file-picking planner based on the query type.
+        if query_type == "broad_query":
+            print("--- Broad query detected. Using full context. ---")
+            relevant_docs = all_docs
+        elif bm25_docs: # "specific_query" with a confident lexical match
+            print(f"--- Specific query detected. BM25 selected {len(bm25_docs)} chunks. ---")
+            relevant_docs = bm25_docs
+        else: # "specific_query"
+            print("--- Specific query detected. Using files picked by the planner... ---")
+            relevant_file_paths = [str(f).strip() for f in planned_files if str(f).strip()]
+            print(f"--- Planner identified relevant files: {relevant_file_paths} ---")
+
+            relevant_docs = list(itertools.chain.from_iterable(
+                by_source.get(path, []) for path in dict.fromkeys(relevant_file_paths)
+            ))
             
-            # Step 4: The final answering step, now with the correct context.
-            context_for_responder = "\n\n---\n\n".join(
-                [f"File: {doc.metadata.get('source')}\n\nContent:\n{doc.page_content}" for doc in relevant_docs]
-            )
+            if not relevant_docs: # Fallback
+                # Checks each unique path once instead of every chunk
+                relevant_docs = list(itertools.chain.from_iterable(
+                    source_docs for source, source_docs in by_source.items() if "README.md" in source
+                ))
+
+        if SHOW_FILE_SHORTCUT and len(relevant_docs) == 1 and _SHOW_FILE_PATTERN.search(question):
+            content = relevant_docs[0].page_content
+            if len(content) < SHOW_FILE_MAX_CHARS:
+                print("--- Show-file request answered without the responder ---")
+                answer = f"Here is `{relevant_docs[0].metadata.get('source')}`:\n\n```\n{content}\n```"
+                response_cache.put(question, answer, question_embedding)
+                return answer, None, question_embedding
+
+        context_for_responder = "\n\n---\n\n".join(
+            [f"File: {doc.metadata.get('source')}\n\nContent:\n{doc.page_content}" for doc in relevant_docs]
+        )
+        print(f"--- Prepared Responder context with {len(relevant_docs)} documents ---")
+        responder_inputs = {"context": context_for_responder, "memory": state.memory.render(), "question": question}
+        return None, responder_inputs, question_embedding
 
-            responder_prompt = ChatPromptTemplate.from_template(
-                """
-                You are Spoon, an expert AI software engineer. Your primary function is to analyze a given codebase and answer questions as a senior developer would.
+    finally:
+        # Never leave a speculative call running past the request
+        for task in (intent_task, query_task, router_task, embedding_task):
+            if task and not task.done():
+                task.cancel()
 
-                **Core Instructions:**
-                1.  **Analyze and Infer**: Your answer MUST be based on the provided CONTEXT. Do not just search for literal text. You are expected to read, understand, and interpret the code and text files to form your conclusions.
-                2.  **Synthesize and Generate**: When asked for abstract concepts like the project's 'purpose', 'problem it solves', 'intended users', or to **generate potential 'use cases'**, you MUST synthesize these answers by analyzing the entire context. Look at API routes, UI elements, dependencies, and comments to determine the application's function, audience, and practical applications.
-                3.  **Be Creative with Use Cases**: When asked for use cases, think practically about who would benefit from this tool and what specific problems it would solve for them. Generate a detailed list based on the project's confirmed features.
-                4.  **No External Knowledge**: Do not use any information outside of the provided CONTEXT. If the context genuinely doesn't provide enough information to form a conclusion, only then should you state that.
 
-                **CONTEXT:**
-                {context}
+async def _plan_files(question, planner_slices):
+    """
+    Runs the intent planner over each manifest slice concurrently and merges the results:
+    the most common intent and query type, and the union of the planned files.
+    """
+    results = await chains.intent_planner_chain.abatch(
+        [{"question": question, "file_manifest": "\n".join(paths)} for paths in planner_slices]
+    )
+    routings = [routing for routing in results if isinstance(routing, dict)]
+    if len(routings) <= 1:
+        return routings[0] if routings else {}
+
+    planned_files = []
+    for routing in routings:
+        files = routing.get("files") or []
+        planned_files.extend(files.split(',') if isinstance(files, str) else files)
+    return {
+        "intent": Counter(classifier.normalize_label(r.get("intent")) for r in routings).most_common(1)[0][0],
+        "query_type": Counter(classifier.normalize_label(r.get("query_type")) for r in routings).most_common(1)[0][0],
+        "files": list(dict.fromkeys(planned_files)),
+    }
 
-                **Question:** {question}
 
-                **Answer:**
-                """
-            )
+@app.route('/api/ask_pdf_question', methods=['POST'])
+async def ask_pdf_question_route():
+    """
+    Handles questions exclusively about a processed PDF.
+    """
+    state = get_state()
+    data = request.get_json()
+    question = data.get('question')
+
+    if not question:
+        return jsonify({"error": "A question is required."}), 400
+    if not state.pdf_docs:
+        return jsonify({"error": "A PDF document must be loaded before asking questions."}), 400
+
+    try:
+        answer, final_chain, final_inputs, question_embedding = await _prepare_pdf_answer(state, question)
+        if answer is None:
+            answer = await final_chain.ainvoke(final_inputs)
+            state.response_cache.put(question, answer, question_embedding)
+        return jsonify({"response": answer}), 200
 
-            responder_chain = responder_prompt | llm | StrOutputParser()
-            
-            print(f"--- Running Responder Chain with {len(relevant_docs)} documents... ---")
-            answer = responder_chain.invoke({
-                "context": context_for_responder,
-                "question": question
-            })
-            
-            return jsonify({"response": answer}), 200
-        
     except Exception as e:
-        print(f"Unexpected error in /api/ask_question: {e}")
-        return jsonify({"error": f"Failed to get a response from the AI. Error: {str(e)}"}), 500
+        print(f"Error in new /api/ask_pdf_question route: {e}")
+        return jsonify({"error": f"An AI error occurred while answering the question about the PDF. Error: {str(e)}"}), 500
 
 
-@app.route('/api/ask_pdf_question', methods=['POST'])
-def ask_pdf_question_route():
+@app.route('/api/ask_pdf_question_stream', methods=['POST'])
+async def ask_pdf_question_stream_route():
     """
-    Handles questions exclusively about a processed PDF.
+    Same as /api/ask_pdf_question, but streams the final answer as Server-Sent Events.
     """
-    global session_data
+    state = get_state()
     data = request.get_json()
     question = data.get('question')
-    pdf_docs = session_data.get("pdf_docs")
 
     if not question:
         return jsonify({"error": "A question is required."}), 400
-    if not pdf_docs:
+    if not state.pdf_docs:
         return jsonify({"error": "A PDF document must be loaded before asking questions."}), 400
 
     try:
-        gemini_api_key = os.getenv("GEMINI_API_KEY")
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest", google_api_key=gemini_api_key, temperature=0.0)
+        answer, final_chain, final_inputs, question_embedding = await _prepare_pdf_answer(state, question)
+    except Exception as e:
+        print(f"Error in /api/ask_pdf_question_stream: {e}")
+        return jsonify({"error": f"An AI error occurred while answering the question about the PDF. Error: {str(e)}"}), 500
 
-        pdf_intent_prompt = ChatPromptTemplate.from_template(
-            """
-            Classify the user's intent for a query about a PDF document. The intents are "pdf_query" or "general_chat".
+    def on_complete(answer_text):
+        state.response_cache.put(question, answer_text, question_embedding)
 
-            - "pdf_query": The user is asking something directly related to the content of the PDF document (e.g., "summarize this document", "what does section 3 say about regulations?", "who is the author?").
-            - "general_chat": The user is making a conversational comment, a greeting, or asking a question not related to the PDF content (e.g., "that's interesting", "thank you", "what else can you do?").
+    return _sse_response(_answer_events(
+        answer, final_chain, final_inputs, on_complete,
+        "/api/ask_pdf_question_stream", "An AI error occurred while answering the question about the PDF."
+    ))
 
-            Based on the user's query below, respond with ONLY "pdf_query" or "general_chat".
 
-            User Query: "{question}"
-            Intent:
-            """
-        )
-        pdf_intent_chain = pdf_intent_prompt | llm | StrOutputParser()
-        intent = pdf_intent_chain.invoke({"question": question})
+async def _prepare_pdf_answer(state, question):
+    """
+    Runs every step before the final answer for a PDF question.
+    Returns (answer, None, None, embedding) when the answer is already known (cache
+    hit or chat reply), otherwise (None, final_chain, final_inputs, embedding), where
+    final_chain is the single responder call or the merge call over the map drafts.
+    """
+    with state.lock:
+        pdf_docs = state.pdf_docs
+        pdf_embeddings = state.pdf_embeddings
+    response_cache = state.response_cache
+
+    canned = classifier.canned_reply(question)
+    if canned is not None:
+        return canned, None, None, None
+
+    cached_answer = response_cache.get(question)
+    if cached_answer is not None:
+        print("--- PDF answer served from exact-match cache ---")
+        return cached_answer, None, None, None
+
+    intent_task = None
+    embedding_task = None
+    try:
+        # The question embedding serves both the semantic cache and chunk retrieval
+        local_intent = classifier.classify_pdf_intent(question)
+        if local_intent is None:
+            intent_task = asyncio.create_task(classifier.classify_with_llm(chains.pdf_intent_chain, question))
+        embedding_task = asyncio.create_task(chains.embeddings.aembed_query(question))
+
+        question_embedding = await embedding_task
+        cached_answer = response_cache.get_similar(question_embedding)
+        if cached_answer is not None:
+            print("--- PDF answer served from semantic cache ---")
+            return cached_answer, None, None, question_embedding
+
+        intent = classifier.normalize_label(await intent_task) if intent_task else local_intent
         print(f"--- PDF Intent Classified as: {intent} ---")
 
-        if "general_chat" in intent.lower():
-            pdf_convo_prompt = ChatPromptTemplate.from_template("You are an AI assistant helping a user understand a PDF. The user has made a conversational comment. Respond politely and briefly. User's comment: '{question}'")
-            pdf_convo_chain = pdf_convo_prompt | llm | StrOutputParser()
-            answer = pdf_convo_chain.invoke({"question": question})
-            return jsonify({"response": answer})
+        if intent == "general_chat":
+            answer = await chains.pdf_convo_chain.ainvoke({"question": question})
+            response_cache.put(question, answer, question_embedding)
+            return answer, None, None, question_embedding
 
+        if intent == "pdf_summary":
+            print("--- PDF summary requested. Using every chunk. ---")
+            relevant_pdf_docs = pdf_docs
         else:
-            chunk_manifest = "\n".join([
-                f"Chunk ID: {doc.metadata['chunk_id']}, Start of content: {doc.page_content[:150]}..."
-                for doc in pdf_docs
-            ])
-
-            pdf_planner_prompt = ChatPromptTemplate.from_template(
-                """
-                You are a research assistant. Your goal is to find the most relevant sections (chunks) of a PDF document to answer a user's question.
-                Review the user's question and the provided manifest of document chunks.
-
-                User Question: "{question}"
-
-                Document Chunk Manifest:
-                {chunk_manifest}
-
-                Instructions:
-                - Identify the Chunk IDs that are most likely to contain the answer.
-                - List only the relevant Chunk IDs, separated by commas.
-                - If the question is a general summary, list all chunk IDs.
-                - Example Response: 1,5,12
-
-                Relevant Chunk IDs:
-                """
-            )
-            pdf_planner_chain = pdf_planner_prompt | llm | StrOutputParser()
-            
-            print("--- Running PDF Planner to find relevant chunks... ---")
-            relevant_chunks_str = pdf_planner_chain.invoke({
-                "question": question,
-                "chunk_manifest": chunk_manifest
-            })
-            
-            try:
-                relevant_chunk_ids = [int(id.strip()) for id in relevant_chunks_str.split(',') if id.strip().isdigit()]
-            except (ValueError, TypeError):
-                relevant_chunk_ids = [doc.metadata['chunk_id'] for doc in pdf_docs]
+            top_indices = retrieval.top_k_similar(pdf_embeddings, question_embedding)
+            relevant_pdf_docs = [pdf_docs[i] for i in top_indices]
+            print(f"--- Embedding search selected chunk IDs: {[doc.metadata['chunk_id'] for doc in relevant_pdf_docs]} ---")
 
-            print(f"--- PDF Planner identified relevant chunk IDs: {relevant_chunk_ids} ---")
+        # Map: answer from each group of chunks concurrently, so no single call carries the whole context
+        responder_inputs = [
+            {"context": _pdf_context(group), "question": question}
+            for group in _split_into_groups(relevant_pdf_docs, PDF_MAP_GROUPS)
+        ] or [{"context": "", "question": question}]
 
-            relevant_pdf_docs = [doc for doc in pdf_docs if doc.metadata.get("chunk_id") in relevant_chunk_ids]
+        # With a single group there is nothing to merge, so the responder itself gives the final answer
+        if len(responder_inputs) == 1:
+            return None, chains.pdf_responder_chain, responder_inputs[0], question_embedding
 
-            context_for_pdf_responder = "\n\n---\n\n".join(
-                [f"Content from Chunk {doc.metadata.get('chunk_id')}:\n{doc.page_content}" for doc in relevant_pdf_docs]
-            )
+        print(f"--- Running PDF Responder over {len(relevant_pdf_docs)} chunks in {len(responder_inputs)} parallel calls... ---")
+        partial_answers = await chains.pdf_responder_chain.abatch(responder_inputs)
 
-            pdf_responder_prompt = ChatPromptTemplate.from_template(
-                """
-                You are Spoon, an expert AI research assistant. Your task is to answer the user's question based on the provided text from a PDF document.
+        # Reduce: one short call merges the drafts
+        merge_inputs = {"drafts": "\n\n---\n\n".join(partial_answers), "question": question}
+        return None, chains.pdf_merge_chain, merge_inputs, question_embedding
 
-                **Core Instructions:**
-                1.  **Synthesize, Don't Hallucinate**: You MUST base your entire answer on the "DOCUMENT CONTEXT". You are encouraged to synthesize information from multiple parts of the context to answer broader questions (like "what is this story about?"). However, do not add information or make assumptions that are not supported by the text.
-                2.  **Handle Missing Information**: If you are truly unable to answer the question from the provided context, state that the answer is not available in the provided text. Do not guess.
-                3.  **Format for Clarity**: Use Markdown for clear formatting (e.g., lists, bolding) to present the answer.
+    finally:
+        for task in (intent_task, embedding_task):
+            if task and not task.done():
+                task.cancel()
 
-                DOCUMENT CONTEXT:
-                {context}
 
-                User's Question: {question}
+# Upper bound on concurrent responder calls per PDF question
+PDF_MAP_GROUPS = 8
 
-                Answer:
-                """
-            )
-            pdf_responder_chain = pdf_responder_prompt | llm | StrOutputParser()
-            
-            print(f"--- Running PDF Responder with {len(relevant_pdf_docs)} documents... ---")
-            answer = pdf_responder_chain.invoke({
-                "context": context_for_pdf_responder,
-                "question": question
-            })
-            
-            return jsonify({"response": answer}), 200
 
-    except Exception as e:
-        print(f"Error in new /api/ask_pdf_question route: {e}")
-        return jsonify({"error": f"An AI error occurred while answering the question about the PDF. Error: {str(e)}"}), 500
+def _split_into_groups(items, max_groups):
+    """Splits items into at most max_groups contiguous, near-equal groups."""
+    if not items:
+        return []
+    group_count = min(max_groups, len(items))
+    size, extra = divmod(len(items), group_count)
+    groups, start = [], 0
+    for i in range(group_count):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(items[start:end])
+        start = end
+    return groups
+
+
+def _pdf_context(pdf_docs):
+    """Formats PDF chunks as responder context, labelled with their chunk ids."""
+    return "\n\n---\n\n".join(
+        [f"Content from Chunk {doc.metadata.get('chunk_id')}:\n{doc.page_content}" for doc in pdf_docs]
+    )
+
+
+# Files above this size are sent in pieces instead of as one serialized body
+STREAM_FILE_THRESHOLD = 256 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _stream_file(file_data):
+    """Yields {"file": ...} as JSON with the file content escaped and sent in slices."""
+    content = file_data["content"]
+    rest = {key: value for key, value in file_data.items() if key != "content"}
+    yield b'{"file":' + orjson.dumps(rest)[:-1] + b',"content":"'
+    for start in range(0, len(content), STREAM_CHUNK_SIZE):
+        # Dumping each slice as its own JSON string and dropping the quotes keeps escaping correct
+        yield orjson.dumps(content[start:start + STREAM_CHUNK_SIZE])[1:-1]
+    yield b'"}}'
 
 
 @app.route('/api/get_repo_tree', methods=['GET'])
 def get_repo_tree_route():
-    global session_data
-    if not session_data.get("repo_url"):
+    state = get_state()
+    repo_url = state.repo_url
+    if not repo_url:
         return jsonify({"error": "No repository loaded."}), 400
     try:
-        tree_data = services.fetch_repo_tree(session_data["repo_url"])
-        return jsonify({"tree": tree_data}), 200
+        # The tree never changes for a loaded repo, so it's fetched and serialized once per session
+        tree_json = state.tree_json
+        if tree_json is None:
+            tree_json = orjson.dumps({"tree": services.fetch_repo_tree(repo_url)})
+            with state.lock:
+                if state.repo_url == repo_url:
+                    state.tree_json = tree_json
+        return Response(tree_json, mimetype="application/json"), 200
     except ValueError as ve:
         return jsonify({"error": str(ve)}), 400
     except Exception as e:
@@ -451,15 +682,17 @@ def get_repo_tree_route():
 
 @app.route('/api/get_file_content', methods=['POST'])
 def get_file_content_route():
-    global session_data
+    state = get_state()
     data = request.get_json()
     file_path = data.get('file_path')
     if not file_path:
         return jsonify({"error": "File path is required"}), 400
-    if not session_data.get("repo_url"):
+    if not state.repo_url:
         return jsonify({"error": "No repository loaded."}), 400
     try:
-        file_data = services.fetch_file_content(session_data["repo_url"], file_path)
+        file_data = services.fetch_file_content(state.repo_url, file_path)
+        if len(file_data.get("content") or "") > STREAM_FILE_THRESHOLD:
+            return Response(_stream_file(file_data), mimetype="application/json"), 200
         return jsonify({"file": file_data}), 200
     except ValueError as ve:
         return jsonify({"error": str(ve)}), 400
@@ -471,14 +704,18 @@ def get_file_content_route():
 @app.route('/api/get_document_content', methods=['GET'])
 def get_document_content_route():
     """Serves the last uploaded document for viewing."""
-    global session_data
-    filename = session_data.get("document_filename")
+    state = get_state()
 
-    if not filename:
+    if not state.document_path:
         return jsonify({"error": "No document has been uploaded in this session."}), 404
 
     try:
-        print(f"Serving file for viewing: {filename} from {app.config['UPLOAD_FOLDER']}")
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        print(f"Serving file for viewing: {state.document_filename} from {app.config['UPLOAD_FOLDER']}")
+        # The URL stays the same across uploads, so the browser must revalidate every time, but an unchanged
+        # document gets a 304. The ETag covers the unique stored path, so a new upload never matches an old one.
+        return send_from_directory(
+            app.config['UPLOAD_FOLDER'], os.path.basename(state.document_path), mimetype=state.document_mimetype,
+            conditional=True, etag=True, max_age=0
+        )
     except FileNotFoundError:
         return jsonify({"error": "Could not find the document file to display."}), 404
\ No newline at end of file
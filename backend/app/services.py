@@ -1,15 +1,89 @@
 # File: backend/app/services.py
 # Purpose: Contains all business logic for fetching and processing data.
 
+import asyncio
+import functools
+import logging
 import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import httpx
 from github import Github, GithubException
-from PyPDF2 import PdfReader
-from io import BytesIO
+import fitz # PyMuPDF
 
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+logger = logging.getLogger(__name__)
+
+# How many file downloads run at once; GitHub's secondary rate limits punish much more
+FETCH_CONCURRENCY = 10
+
+# File texts are fetched through GraphQL, this many files per query
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+GRAPHQL_BATCH_SIZE = 50
+
+# Head lookups go straight to the REST API so they can be conditional; PyGithub never sends If-None-Match
+GITHUB_API_URL = "https://api.github.com"
+MAX_ETAGS = 256
+_http_client = httpx.Client(timeout=30.0)
+_etags = OrderedDict() # url -> (etag, head sha)
+_etags_lock = threading.Lock()
+
+# Page text extraction is CPU-bound, so long PDFs are split into page ranges across processes.
+# Short ones aren't worth the cost of shipping the bytes to the workers.
+PDF_PARALLEL_MIN_PAGES = 32
+PDF_WORKERS = os.cpu_count() or 1
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+class _LRUCache:
+    """Small thread-safe LRU map for results pinned to a commit SHA, which never go stale."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+# Files with these suffixes aren't text; names are lowercased before matching
+_BINARY_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.ico', '.zip', '.pdf', '.woff', '.woff2', '.ds_store')
+# Loading also skips generated files that are large and say nothing about the code
+_SKIPPED_DOC_SUFFIXES = _BINARY_EXTENSIONS + ('package-lock.json',)
+
+# Chunks are measured in tokens, which is what embedding and prompt limits actually count.
+# cl100k_base isn't Gemini's tokenizer but tracks it closely on English and code; 1024 tokens
+# is roughly the old 4000 characters, so retrieval and prompt budgets stay about where they were.
+# Splitters hold no per-call state, so one of each is shared by every load.
+_TEXT_SPLITTER = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    encoding_name="cl100k_base", chunk_size=1024, chunk_overlap=128
+)
+_PDF_SPLITTER = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    encoding_name="cl100k_base", chunk_size=768, chunk_overlap=96
+)
+
+# Keyed by (repo, head commit SHA): a push changes the key, so nothing needs invalidating.
+# Loaded docs are by far the largest entries, so only a few repos' worth are kept.
+_docs_cache = _LRUCache(max_entries=8)
+_tree_cache = _LRUCache(max_entries=32)
+_file_cache = _LRUCache(max_entries=256)
+
 
 def fetch_repo_docs(repo_url):
     """
@@ -21,54 +95,16 @@ def fetch_repo_docs(repo_url):
         raise ValueError("GitHub token not set. Please set the GITHUB_TOKEN environment variable.")
 
     try:
-        g = Github(GITHUB_TOKEN)
-        repo_path = repo_url.replace('https://github.com/', '').strip('/')
-        repo = g.get_repo(repo_path)
-        print(f"Fetching docs for: {repo_path}")
+        repo_path = _parse_repo_path(repo_url)
+        repo = _get_repo(GITHUB_TOKEN, repo_path)
+        head_sha = _get_head_sha(repo_path, GITHUB_TOKEN)
+        logger.info("Fetching docs for: %s at %s", repo_path, head_sha[:7])
 
-        docs = []
-        
-        # 1. Add README as a document
-        try:
-            readme_content = repo.get_contents("README.md").decoded_content.decode('utf-8')
-            docs.append(Document(page_content=readme_content, metadata={"source": "README.md"}))
-        except Exception:
-            # If no README, add a placeholder document
-            docs.append(Document(page_content="No README.md found in the repository.", metadata={"source": "README.md"}))
-
-        # 2. Add repository structure as a document
-        structure = _get_repo_structure(repo)
-        docs.append(Document(page_content=f"This is the repository file structure:\n{structure}", metadata={"source": "Repository Structure"}))
-
-        # 3. Add source code files as documents, chunking if necessary
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=4000, chunk_overlap=200)
-        
-        contents = repo.get_contents("")
-        while contents:
-            file_content = contents.pop(0)
-            if file_content.type == "dir":
-                # Add sub-directory contents to the processing list
-                contents.extend(repo.get_contents(file_content.path))
-            else:
-                # Skip binary, large, or irrelevant files
-                binary_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.ico', '.zip', '.pdf', '.woff', '.woff2', '.DS_Store', 'package-lock.json']
-                if any(file_content.name.lower().endswith(ext) for ext in binary_extensions) or file_content.size > 100000:
-                    continue
-                
-                try:
-                    content = file_content.decoded_content.decode('utf-8')
-                    # Split large files into manageable chunks
-                    chunks = text_splitter.split_text(content)
-                    for i, chunk in enumerate(chunks):
-                        docs.append(Document(
-                            page_content=chunk, 
-                            metadata={"source": file_content.path, "chunk": i}
-                        ))
-                except UnicodeDecodeError:
-                    print(f"Skipping non-UTF-8 file: {file_content.path}")
-        
-        print(f"Created {len(docs)} documents for the repository.")
-        return docs
+        # Content is pinned to the head commit, so reloading an unchanged repo needs no downloads
+        docs = _docs_cache.get_or_compute(
+            (repo_path, head_sha), lambda: _build_repo_docs(repo, repo_path, head_sha, GITHUB_TOKEN)
+        )
+        return list(docs)
 
     except GithubException as e:
         raise ValueError(f"Failed to fetch repository '{repo_path}': {e.data.get('message', 'Check URL and token permissions.')}")
@@ -76,6 +112,161 @@ def fetch_repo_docs(repo_url):
         raise ValueError(f"An unexpected error occurred: {str(e)}")
 
 
+def _parse_repo_path(repo_url):
+    return repo_url.replace('https://github.com/', '').strip('/')
+
+
+@functools.lru_cache(maxsize=4)
+def _get_github(token):
+    # One client per token, so its HTTP session and keep-alive connections are reused across requests
+    return Github(token)
+
+
+@functools.lru_cache(maxsize=16)
+def _get_repo(token, repo_path):
+    # Lazy, so no API call is made unless something actually needs fetching
+    return _get_github(token).get_repo(repo_path, lazy=True)
+
+
+def _build_repo_docs(repo, repo_path, head_sha, token):
+    """Downloads the repository at the given commit and returns it as a list of Document objects."""
+    # One recursive Git Trees call lists every path and size, instead of one call per directory
+    tree_elements = _get_tree_elements(repo, repo_path, head_sha)
+
+    files_to_fetch = []
+    for element in tree_elements:
+        if element.type != "blob":
+            continue
+        # Skip binary, large, or irrelevant files
+        if element.path.lower().endswith(_SKIPPED_DOC_SUFFIXES) or element.size > 100000:
+            continue
+        files_to_fetch.append(element)
+
+    # Fetch file texts in batched GraphQL queries instead of one REST call per file
+    owner, name = repo_path.split("/")[:2]
+    file_texts = asyncio.run(_fetch_file_texts(
+        token, owner, name, head_sha, [element.path for element in files_to_fetch]
+    ))
+
+    # 1. Add README as a document. The batch above usually has it already; only a README
+    # it skipped (too large, or not valid text) costs a request of its own.
+    readme_content = next(
+        (content for element, content in zip(files_to_fetch, file_texts) if element.path == "README.md"), None
+    )
+    if readme_content is None:
+        has_readme = any(element.path == "README.md" for element in tree_elements)
+        readme_content = _fetch_readme(repo, head_sha) if has_readme else None
+    if readme_content is None:
+        # If no README, add a placeholder document
+        readme_content = "No README.md found in the repository."
+    docs = [Document(page_content=readme_content, metadata={"source": "README.md"})]
+
+    # 2. Add repository structure as a document
+    structure = _get_repo_structure(tree_elements)
+    docs.append(Document(page_content=f"This is the repository file structure:\n{structure}", metadata={"source": "Repository Structure"}))
+
+    # 3. Add source code files as documents, chunking if necessary
+    for file_content, content in zip(files_to_fetch, file_texts):
+        if content is None:
+            logger.debug("Skipping binary or unavailable file: %s", file_content.path)
+            continue
+        # Split large files into manageable chunks
+        docs.extend(
+            Document(page_content=chunk, metadata={"source": file_content.path, "chunk": i})
+            for i, chunk in enumerate(_TEXT_SPLITTER.split_text(content))
+        )
+    
+    logger.info("Created %d documents for the repository.", len(docs))
+    return docs
+
+
+def _fetch_readme(repo, head_sha):
+    try:
+        # A stray non-UTF-8 byte shouldn't cost the whole README
+        return repo.get_contents("README.md", ref=head_sha).decoded_content.decode('utf-8', errors='replace')
+    except Exception:
+        return None
+
+
+def _get_head_sha(repo_path, token):
+    """
+    Returns the commit SHA at the head of the default branch, which keys every cached result.
+    The request is conditional on the last ETag seen, and GitHub doesn't count a
+    304 Not Modified against the rate limit.
+    """
+    url = f"{GITHUB_API_URL}/repos/{repo_path}/commits/HEAD"
+    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.sha"}
+    with _etags_lock:
+        cached = _etags.get(url)
+    if cached:
+        headers["If-None-Match"] = cached[0]
+
+    response = _http_client.get(url, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached[1]
+    if response.status_code != 200:
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        raise GithubException(response.status_code, data, dict(response.headers))
+
+    head_sha = response.text.strip()
+    etag = response.headers.get("ETag")
+    if etag:
+        with _etags_lock:
+            _etags[url] = (etag, head_sha)
+            _etags.move_to_end(url)
+            if len(_etags) > MAX_ETAGS:
+                _etags.popitem(last=False)
+    return head_sha
+
+
+def _get_tree_elements(repo, repo_path, head_sha):
+    """
+    Lists every file and directory at the given commit with a single recursive
+    Git Trees API call, in depth-first order (each directory before its contents).
+    """
+    return _tree_cache.get_or_compute(
+        (repo_path, head_sha), lambda: repo.get_git_tree(head_sha, recursive=True).tree
+    )
+
+
+async def _fetch_file_texts(token, owner, name, ref, paths):
+    """
+    Fetches the text of many files through the GraphQL API, GRAPHQL_BATCH_SIZE files per
+    query with the queries sent concurrently. Returns each file's text, or None for binary
+    files and failed batches, in input order.
+    """
+    headers = {"Authorization": f"bearer {token}"}
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    batches = [paths[i:i + GRAPHQL_BATCH_SIZE] for i in range(0, len(paths), GRAPHQL_BATCH_SIZE)]
+
+    async with httpx.AsyncClient(headers=headers, timeout=60.0) as client:
+        async def fetch_batch(batch):
+            # Each file is an aliased field; paths go in as variables so they need no escaping
+            variables = {"owner": owner, "name": name}
+            variables.update({f"e{i}": f"{ref}:{path}" for i, path in enumerate(batch)})
+            params = "".join(f", $e{i}: String!" for i in range(len(batch)))
+            fields = " ".join(f"f{i}: object(expression: $e{i}) {{ ... on Blob {{ text isBinary }} }}" for i in range(len(batch)))
+            query = f"query($owner: String!, $name: String!{params}) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}"
+
+            async with semaphore:
+                try:
+                    response = await client.post(GITHUB_GRAPHQL_URL, json={"query": query, "variables": variables})
+                    response.raise_for_status()
+                    repository = (response.json().get("data") or {}).get("repository") or {}
+                except (httpx.HTTPError, ValueError) as e:
+                    logger.warning("Could not fetch a batch of %d files: %s", len(batch), e)
+                    return [None] * len(batch)
+
+            blobs = [repository.get(f"f{i}") or {} for i in range(len(batch))]
+            return [None if blob.get("isBinary") else blob.get("text") for blob in blobs]
+
+        batch_texts = await asyncio.gather(*(fetch_batch(batch) for batch in batches))
+    return [text for texts in batch_texts for text in texts]
+
+
 def fetch_repo_tree(repo_url):
     """
     Fetches the repository structure as a tree for UI display.
@@ -86,17 +277,17 @@ def fetch_repo_tree(repo_url):
         raise ValueError("GitHub token not set. Please set the GITHUB_TOKEN environment variable.")
 
     try:
-        g = Github(GITHUB_TOKEN)
-        repo_path = repo_url.replace('https://github.com/', '').strip('/')
-        repo = g.get_repo(repo_path)
+        repo_path = _parse_repo_path(repo_url)
+        repo = _get_repo(GITHUB_TOKEN, repo_path)
 
-        print(f"Building tree for: {repo_path}")
+        logger.info("Building tree for: %s", repo_path)
+        tree_elements = _get_tree_elements(repo, repo_path, _get_head_sha(repo_path, GITHUB_TOKEN))
         
         tree_data = {
-            "name": repo.name,
+            "name": repo_path.split("/")[-1],
             "type": "repository",
             "path": "",
-            "children": _build_tree_structure(repo)
+            "children": _build_tree_structure(tree_elements)
         }
         
         return tree_data
@@ -107,45 +298,43 @@ def fetch_repo_tree(repo_url):
         raise ValueError(f"An unexpected error occurred: {str(e)}")
 
 
-def _build_tree_structure(repo, path=""):
-    """Helper to recursively build a hierarchical tree structure."""
-    tree_items = []
-    binary_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.ico', '.zip', '.pdf', '.woff', '.woff2', '.DS_Store']
-    
-    try:
-        contents = repo.get_contents(path)
-        
-        directories = sorted([c for c in contents if c.type == "dir"], key=lambda x: x.name.lower())
-        files = sorted([c for c in contents if c.type == "file"], key=lambda x: x.name.lower())
-        
-        for content in directories:
-            tree_items.append({
-                "name": content.name,
+def _build_tree_structure(tree_elements):
+    """Helper to build a hierarchical tree structure from the flat Git Trees listing."""
+    children_by_path = {"": []}
+
+    for element in tree_elements:
+        parent_path, _, name = element.path.rpartition("/")
+        if element.type == "tree":
+            item = {
+                "name": name,
                 "type": "directory",
-                "path": content.path,
-                "children": _build_tree_structure(repo, content.path)
-            })
-        
-        for content in files:
-            is_binary = any(content.name.lower().endswith(ext) for ext in binary_extensions)
-            is_large = content.size > 100000
-            
-            tree_items.append({
-                "name": content.name,
+                "path": element.path,
+                "children": []
+            }
+            children_by_path[element.path] = item["children"]
+        elif element.type == "blob":
+            is_binary = name.lower().endswith(_BINARY_EXTENSIONS)
+            is_large = element.size > 100000
+
+            item = {
+                "name": name,
                 "type": "file",
-                "path": content.path,
-                "size": content.size,
+                "path": element.path,
+                "size": element.size,
                 "is_binary": is_binary,
                 "is_large": is_large,
                 "viewable": not (is_binary or is_large)
-            })
-            
-    except GithubException as e:
-        print(f"Could not list contents of {path}: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred while building tree for {path}: {e}")
-        
-    return tree_items
+            }
+        else:
+            # Submodules point at other repositories and have no content here
+            continue
+        children_by_path.setdefault(parent_path, []).append(item)
+
+    # Directories first, then files, each sorted by name
+    for items in children_by_path.values():
+        items.sort(key=lambda item: (item["type"] != "directory", item["name"].lower()))
+
+    return children_by_path[""]
 
 
 def fetch_file_content(repo_url, file_path):
@@ -157,29 +346,14 @@ def fetch_file_content(repo_url, file_path):
         raise ValueError("GitHub token not set. Please set the GITHUB_TOKEN environment variable.")
 
     try:
-        g = Github(GITHUB_TOKEN)
-        repo_path = repo_url.replace('https://github.com/', '').strip('/')
-        repo = g.get_repo(repo_path)
+        repo_path = _parse_repo_path(repo_url)
+        repo = _get_repo(GITHUB_TOKEN, repo_path)
 
-        print(f"Fetching file content for: {file_path}")
-        
-        file_content = repo.get_contents(file_path)
-        
-        binary_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.ico', '.zip', '.pdf', '.woff', '.woff2', '.DS_Store']
-        is_binary = any(file_path.lower().endswith(ext) for ext in binary_extensions)
-        is_large = file_content.size > 500000
-        
-        if is_binary:
-            return {"path": file_path, "content": None, "error": "Binary file - content not displayable", "is_binary": True, "size": file_content.size}
-        
-        if is_large:
-            return {"path": file_path, "content": None, "error": "File too large to display", "is_binary": False, "size": file_content.size}
-        
-        try:
-            content = file_content.decoded_content.decode('utf-8')
-            return {"path": file_path, "content": content, "error": None, "is_binary": False, "size": file_content.size}
-        except UnicodeDecodeError:
-            return {"path": file_path, "content": None, "error": "File contains non-UTF-8 content and cannot be displayed", "is_binary": True, "size": file_content.size}
+        logger.info("Fetching file content for: %s", file_path)
+        head_sha = _get_head_sha(repo_path, GITHUB_TOKEN)
+        return _file_cache.get_or_compute(
+            (repo_path, head_sha, file_path), lambda: _fetch_file_content(repo, head_sha, file_path)
+        )
 
     except GithubException as e:
         raise ValueError(f"Failed to fetch file '{file_path}': {e.data.get('message', 'File not found or access denied.')}")
@@ -187,33 +361,48 @@ def fetch_file_content(repo_url, file_path):
         raise ValueError(f"An unexpected error occurred: {str(e)}")
 
 
-def _get_repo_structure(repo, path="", indent=""):
-    """Helper to recursively build a text representation of the repo structure."""
-    structure = ""
+def _fetch_file_content(repo, head_sha, file_path):
+    """Fetches one file at the given commit and describes it for the viewer."""
+    file_content = repo.get_contents(file_path, ref=head_sha)
+    
+    is_binary = file_path.lower().endswith(_BINARY_EXTENSIONS)
+    is_large = file_content.size > 500000
+    
+    if is_binary:
+        return {"path": file_path, "content": None, "error": "Binary file - content not displayable", "is_binary": True, "size": file_content.size}
+    
+    if is_large:
+        return {"path": file_path, "content": None, "error": "File too large to display", "is_binary": False, "size": file_content.size}
+    
     try:
-        contents = repo.get_contents(path)
-        for content in contents:
-            if content.type == "dir":
-                structure += f"{indent}📁 {content.name}/\n"
-                structure += _get_repo_structure(repo, content.path, indent + "  ")
-            else:
-                structure += f"{indent}📄 {content.name}\n"
-    except GithubException:
-        pass
-    except Exception as e:
-        print(f"Could not list contents of {path}: {e}")
-    return structure
-
-
-def process_uploaded_file_docs(file_stream):
+        content = file_content.decoded_content.decode('utf-8')
+        return {"path": file_path, "content": content, "error": None, "is_binary": False, "size": file_content.size}
+    except UnicodeDecodeError:
+        return {"path": file_path, "content": None, "error": "File contains non-UTF-8 content and cannot be displayed", "is_binary": True, "size": file_content.size}
+
+
+def _get_repo_structure(tree_elements):
+    """Helper to build a text representation of the repo structure from the flat Git Trees listing."""
+    lines = []
+    for element in tree_elements:
+        indent = "  " * element.path.count("/")
+        name = element.path.rpartition("/")[2]
+        if element.type == "tree":
+            lines.append(f"{indent}📁 {name}/\n")
+        else:
+            lines.append(f"{indent}📄 {name}\n")
+    return "".join(lines)
+
+
+def process_uploaded_file_docs(file_stream, filename):
     """
-    Processes a .md or .txt file from an in-memory stream.
+    Processes a .md or .txt file from an uploaded file stream.
     """
-    filename = file_stream.filename
-    print(f"Processing uploaded file stream: {filename}")
+    logger.info("Processing uploaded file stream: %s", filename)
     
     raw_text = ""
     if filename.lower().endswith(('.md', '.txt')):
+        file_stream.seek(0)
         raw_text = file_stream.read().decode('utf-8')
     else:
         # This function should not be called for other types
@@ -222,49 +411,64 @@ def process_uploaded_file_docs(file_stream):
     if not raw_text.strip():
         return []
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=4000, chunk_overlap=200)
-    chunks = text_splitter.split_text(raw_text)
-    
-    docs = []
-    for i, chunk in enumerate(chunks):
-        docs.append(Document(
-            page_content=chunk,
-            metadata={"source": filename, "chunk": i}
-        ))
-        
-    print(f"Created {len(docs)} documents for {filename}.")
+    docs = [
+        Document(page_content=chunk, metadata={"source": filename, "chunk": i})
+        for i, chunk in enumerate(_TEXT_SPLITTER.split_text(raw_text))
+    ]
+
+    logger.info("Created %d documents for %s.", len(docs), filename)
     return docs
 
-def process_pdf_file_and_chunk(file_stream):
+def process_pdf_file_and_chunk(file_stream, filename):
     """
-    Processes a PDF file from an in-memory stream.
+    Processes a PDF file from an uploaded file stream.
     """
-    filename = file_stream.filename
-    print(f"Processing PDF stream: {filename}")
+    logger.info("Processing PDF stream: %s", filename)
 
-    raw_text = ""
     try:
-        # Read PDF content from the in-memory stream
-        pdf_reader = PdfReader(BytesIO(file_stream.read()))
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                raw_text += page_text
+        # MuPDF parses several times faster than a pure-Python reader; closing the
+        # document as soon as the text is out releases its native buffers
+        file_stream.seek(0)
+        pdf_bytes = file_stream.read()
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+            page_count = pdf_document.page_count
+            if page_count < PDF_PARALLEL_MIN_PAGES:
+                raw_text = "".join(page.get_text("text") for page in pdf_document)
+        if page_count >= PDF_PARALLEL_MIN_PAGES:
+            raw_text = _extract_pdf_text_parallel(pdf_bytes, page_count)
     except Exception as e:
         raise ValueError(f"Could not read the provided PDF stream: {e}")
 
     if not raw_text.strip():
         return []
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=3000, chunk_overlap=150)
-    chunks = text_splitter.split_text(raw_text)
+    pdf_docs = [
+        Document(page_content=chunk_content, metadata={"source": filename, "chunk_id": i})
+        for i, chunk_content in enumerate(_PDF_SPLITTER.split_text(raw_text))
+    ]
+
+    logger.info("Successfully created %d chunks for %s.", len(pdf_docs), filename)
+    return pdf_docs
+
+
+def _extract_pdf_text_parallel(pdf_bytes, page_count):
+    """Extracts page text in contiguous page ranges, one range per worker process, in page order."""
+    pool = _get_pdf_pool()
+    range_size = -(-page_count // PDF_WORKERS)
+    starts = range(0, page_count, range_size)
+    stops = [min(start + range_size, page_count) for start in starts]
+    return "".join(pool.map(_extract_page_range, [pdf_bytes] * len(starts), starts, stops))
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _pdf_pool
 
-    pdf_docs = []
-    for i, chunk_content in enumerate(chunks):
-        pdf_docs.append(Document(
-            page_content=chunk_content,
-            metadata={"source": filename, "chunk_id": i}
-        ))
 
-    print(f"Successfully created {len(pdf_docs)} chunks for {filename}.")
-    return pdf_docs
\ No newline at end of file
+def _extract_page_range(pdf_bytes, start, stop):
+    # Runs in a worker process; MuPDF documents can't be pickled, so each worker opens its own
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        return "".join(pdf_document[i].get_text("text") for i in range(start, stop))
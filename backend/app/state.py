@@ -0,0 +1,88 @@
+# File: backend/app/state.py
+# Purpose: Per-browser session state, keyed by a cookie, so concurrent users don't share loaded data.
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+
+from flask import g, request
+
+from .cache import ResponseCache
+from .memory import ConversationMemory
+
+SESSION_COOKIE = "sid"
+
+# Loaded repos can be tens of MB, so only keep the most recently used sessions around
+MAX_SESSIONS = 32
+
+
+@dataclass
+class SessionState:
+    """Everything loaded for one browser session."""
+    docs: list = None
+    by_source: dict = None # Maps each source path to its document chunks
+    bm25: object = None # Lexical index over "docs" used in place of the LLM planner
+    file_manifest: list = None # Unique source paths, in load order
+    repo_url: str = None
+    tree_json: bytes = None # Serialized /api/get_repo_tree response, built on first request
+    pdf_docs: list = None
+    pdf_embeddings: object = None # float32 matrix, one unit-length row per PDF chunk
+    document_filename: str = None # Stores filename for the viewer
+    document_path: str = None # Where the upload was spooled to disk for the viewer
+    document_mimetype: str = None # Stores the file's mimetype
+    load_job_id: str = None # The background load whose results this session is waiting for
+    response_cache: ResponseCache = field(default_factory=ResponseCache)
+    memory: ConversationMemory = field(default_factory=ConversationMemory) # Recent repo/file Q&A turns
+    # Guards multi-field updates: request threads and background load jobs share this state
+    lock: object = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    def clear(self):
+        """Drops all loaded data so a new repo or document starts from a clean slate."""
+        with self.lock:
+            if self.document_path:
+                try:
+                    os.remove(self.document_path)
+                except OSError:
+                    pass
+            for f in fields(self):
+                if f.name not in ("response_cache", "memory", "lock"):
+                    setattr(self, f.name, None)
+            self.response_cache.reset()
+            self.memory.clear()
+
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def get_state():
+    """Returns the SessionState for the current request, creating a new session if needed."""
+    if "session_state" in g:
+        return g.session_state
+
+    session_id = request.cookies.get(SESSION_COOKIE)
+    with _sessions_lock:
+        state = _sessions.get(session_id) if session_id else None
+        if state is None:
+            session_id = uuid.uuid4().hex
+            state = SessionState()
+            _sessions[session_id] = state
+            g.new_session_id = session_id
+            if len(_sessions) > MAX_SESSIONS:
+                _, evicted = _sessions.popitem(last=False)
+                evicted.clear() # Also deletes its spooled upload
+        else:
+            _sessions.move_to_end(session_id)
+
+    g.session_state = state
+    return state
+
+
+def attach_session_cookie(response):
+    """after_request hook that hands a newly created session id to the browser."""
+    session_id = g.pop("new_session_id", None)
+    if session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
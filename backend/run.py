@@ -1,8 +1,39 @@
 from app import app
 import os
 
+# Sessions live in this process's memory, so there is one server process and concurrency comes from threads
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 8))
+# Answers stream for as long as the model takes, so workers get longer than gunicorn's 30s default
+WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", 120))
+
+
+def serve(port):
+    """Runs the app under gunicorn's threaded worker, or Werkzeug's threaded server where gunicorn can't run (Windows)."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        app.run(host="0.0.0.0", port=port, threaded=True)
+        return
+
+    class SpoonApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", WEB_THREADS)
+            self.cfg.set("timeout", WEB_TIMEOUT)
+
+        def load(self):
+            return app
+
+    SpoonApplication().run()
+
+
 if __name__ == '__main__':
     # The port can be set in the .env file or default to 5000
     port = int(os.environ.get("PORT", 5000))
-    # debug=True is great for development
-    app.run(debug=True, host="0.0.0.0", port=port)
\ No newline at end of file
+    if os.environ.get("FLASK_ENV") == "development":
+        # debug=True is great for development
+        app.run(debug=True, host="0.0.0.0", port=port)
+    else:
+        serve(port)